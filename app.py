@@ -4,7 +4,6 @@ faulthandler.enable(all_threads=True)
 
 import streamlit as st
 import pandas as pd
-import time
 import re
 import sys
 import platform
@@ -25,40 +24,96 @@ def diag(message):
     print(f"[DIAG] {message}", flush=True)
 
 
-diag(
-    "startup "
-    f"python={sys.version.split()[0]} "
-    f"platform={platform.platform()} "
-    f"streamlit={get_package_version('streamlit')} "
-    f"pandas={get_package_version('pandas')} "
-    f"numpy={get_package_version('numpy')} "
-    f"pyarrow={get_package_version('pyarrow')} "
-    f"protobuf={get_package_version('protobuf')} "
-    f"plotly={get_package_version('plotly')}"
+TABLE_PAGE_SIZE = 200
+
+# 卡片文字拆解用的 regex，模組載入時編譯一次
+PAREN_NOTE_RE = re.compile(r"(.+?)\s*([\(（].+?[\)）])")
+PAREN_NOTE_MULTILINE_RE = re.compile(r"(.+?)\s*([\(（].+?[\)）])", re.DOTALL)
+PAREN_CHARS_RE = re.compile(r"[（）\(\)]")
+SECTION_TITLE_RE = re.compile(r"(.+?)\s*[（\(](.+)[）\)]")
+
+# 狀態文字 → 卡片顏色；依序比對第一個出現的關鍵字 (「高警戒」須排在「警戒」之前)
+PLEDGE_STATUS_COLORS = (
+    ("安全", "#009900"),
+    ("謹慎", "#0EA5E9"),
+    ("高警戒", "#EA580C"),
+    ("警戒", "#F59E0B"),
+    ("危險", "#FF0000"),
+)
+RISK_LEVEL_COLORS = (
+    ("紅", "#FF0000"),
+    ("橘", "#EA580C"),
+    ("黃", "#F59E0B"),
+    ("綠", "#009900"),
 )
+DEFAULT_STATUS_COLOR = "#334155"
+
+
+def status_color(text, palette):
+    return next((color for key, color in palette if key in text), DEFAULT_STATUS_COLOR)
+
+
+def paginate_frame(df, key):
+    """大表分頁：只回傳目前頁面的列，格式化與傳送前端都只處理這一頁"""
+    pages = max(1, -(-len(df) // TABLE_PAGE_SIZE))
+    if pages == 1:
+        return df
+    # 頁次只由 session_state 控制 (不另給 value=，否則 Streamlit 每次重跑都警告預設值與 Session State 衝突)；
+    # 篩選後頁數變少時先夾回最後一頁，未設定時預設為 min_value 即第 1 頁
+    if st.session_state.get(key, 1) > pages:
+        st.session_state[key] = pages
+    page = st.number_input(f"頁次（共 {pages} 頁）", min_value=1, max_value=pages, step=1, key=key)
+    start = (page - 1) * TABLE_PAGE_SIZE
+    return df.iloc[start:start + TABLE_PAGE_SIZE]
+
+
+def number_columns(money_cols=(), int_cols=()):
+    """數字欄顯示設定：欄位維持數值 (排序正確)，千分位與小數位交給前端依語系格式化"""
+    config = {c: st.column_config.NumberColumn(format="localized", step=0.01) for c in money_cols}
+    config.update({c: st.column_config.NumberColumn(format="localized", step=1) for c in int_cols})
+    return config
+
+
+# 環境版本每個行程只需記錄一次；逐一查 importlib.metadata 每次約數毫秒，不必在每次重跑都做
+@st.cache_resource(show_spinner=False)
+def log_startup():
+    diag(
+        "startup "
+        f"python={sys.version.split()[0]} "
+        f"platform={platform.platform()} "
+        f"streamlit={get_package_version('streamlit')} "
+        f"pandas={get_package_version('pandas')} "
+        f"numpy={get_package_version('numpy')} "
+        f"pyarrow={get_package_version('pyarrow')} "
+        f"protobuf={get_package_version('protobuf')} "
+        f"plotly={get_package_version('plotly')}"
+    )
+
+
+log_startup()
 
 # 設置頁面配置
 st.set_page_config(layout="wide", page_title="投資組合儀表板")
 
-# 注入 CSS (來自 visuals.py)
-st.markdown(vis.get_custom_css(), unsafe_allow_html=True)
+# 注入 CSS (來自 visuals.py)；st.html 直接送出原始 HTML，不經 markdown 解析，純 <style> 也不佔版面
+st.html(vis.CUSTOM_CSS)
 
 if 'live_prices' not in st.session_state:
     st.session_state['live_prices'] = {}
 
 # === 主程式 ===
 
+def show_snapshot_notice(snapshot_at):
+    """資料來自重啟前的磁碟快照時標示出來，背景更新完成前使用者才知道數字不是最新的"""
+    if snapshot_at:
+        st.caption(f"⏳ 目前顯示 {datetime.fromtimestamp(snapshot_at):%m/%d %H:%M:%S} 的快照資料，背景更新中，稍後重新整理即為最新")
+
+
 # 載入基礎資料 (供側邊欄與下方區塊使用)
 diag("01 base data loading start")
+# 其餘分頁資料 (表D~表G) 延後到各自區塊才讀取，避免首屏等待所有工作表
 df_A = dm.load_data('表A_持股總表')
 df_B = dm.load_data('表B_持股比例')
-df_C_base = dm.load_live_data('表C_總覽')
-df_D = dm.load_data('表D_現金流')
-df_E = dm.load_data('表E_已實現損益')
-df_F = dm.load_data('表F_每日淨值')
-df_G = dm.load_data('表G_財富藍圖') 
-df_Monitor_base = dm.load_live_data('即時監控面板')
-df_Market_base = dm.load_live_data('Market')
 diag("02 base data loading complete")
 
 # 決定標題日期字串 (直接抓取系統今日時間)
@@ -66,22 +121,19 @@ today = datetime.now()
 date_str = f" - {today.year}年{today.month}月{today.day}日"
 
 st.title(f'💰 投資組合儀表板{date_str}')
+show_snapshot_notice(dm.snapshot_time())
 
 # --- Sidebar ---
 st.sidebar.header("🎯 數據管理")
 if st.sidebar.button("🔄 重新載入全域資料"):
-    dm.load_data.clear()
-    dm.load_live_data.clear()
-    dm.load_firepower_mode.clear()
+    dm.clear_sheet_cache()
     st.rerun()
 
 # 強制同步：清除 Streamlit 快取避免前端仍顯示舊圖
 if st.sidebar.button("🧹 強制清除快取並重跑"):
     st.cache_data.clear()
     st.cache_resource.clear()
-    dm.load_data.clear()
-    dm.load_live_data.clear()
-    dm.load_firepower_mode.clear()
+    dm.clear_sheet_cache()
     st.rerun()
 
 # 戰術升級：局部無感跳動開關
@@ -104,26 +156,40 @@ if auto_refresh:
         f"🟢 戰術雷達：局部掃描啟動（每 {refresh_seconds} 秒）"
     )
 
-if st.sidebar.button("💾 更新股價至 Google Sheets", type="primary"):
-    if not df_A.empty and '股票' in df_A.columns:
-        tickers = [t for t in df_A['股票'].unique() if str(t).strip()]
-        st.toast(f"正在更新 {len(tickers)} 檔股價...", icon="⏳")
-        updates = dm.fetch_current_prices(tickers)
-        st.session_state['live_prices'] = updates
-        if updates:
-            success = dm.write_prices_to_sheet(df_A, updates)
-            if success:
-                st.sidebar.success(f"成功更新 {len(updates)} 檔股價！")
-                time.sleep(1)
-                dm.load_data.clear()
-                st.rerun()
-        else:
-            st.sidebar.warning("未能取得任何股價，請檢查代碼或網路。")
+# 更新股價按鈕放在 fragment 內：點擊只重跑這一段，寫入成功後才整頁重跑一次載入新數據
+@st.fragment
+def render_price_update_fragment(df_A):
+    if st.button("💾 更新股價至 Google Sheets", type="primary"):
+        if not df_A.empty and '股票' in df_A.columns:
+            tickers = df_A.loc[df_A['股票'].astype(str).str.strip() != '', '股票'].unique().tolist()
+            st.toast(f"正在更新 {len(tickers)} 檔股價...", icon="⏳")
+            updates = dm.fetch_current_prices(tickers)
+            st.session_state['live_prices'] = updates
+            if updates:
+                success = dm.write_prices_to_sheet(df_A, updates)
+                if success:
+                    st.toast(f"成功更新 {len(updates)} 檔股價！", icon="✅")
+                    dm.clear_sheet_cache(live=False)
+                    st.rerun()
+            else:
+                st.warning("未能取得任何股價，請檢查代碼或網路。")
+
+with st.sidebar:
+    render_price_update_fragment(df_A)
 
 st.sidebar.markdown("---")
 st.sidebar.subheader("📋 匯出功能")
 if st.sidebar.button("產生文字日報"):
-    report_text = dm.generate_daily_report(df_A, df_C_base, df_D, df_E, df_F, df_Monitor_base, st.session_state['live_prices'], df_Market_base)
+    report_text = dm.generate_daily_report(
+        df_A,
+        dm.load_live_data('表C_總覽'),
+        dm.load_data('表D_現金流'),
+        dm.load_data('表E_已實現損益'),
+        dm.load_data('表F_每日淨值'),
+        dm.load_live_data('即時監控面板'),
+        st.session_state['live_prices'],
+        dm.load_live_data('Market'),
+    )
     st.sidebar.markdown("請點擊下方代碼區塊右上角的 **複製按鈕**：")
     st.sidebar.code(report_text, language='text')
 
@@ -144,10 +210,11 @@ def render_live_monitoring_fragment():
     df_Monitor = dm.load_live_data('即時監控面板')
     df_C = dm.load_live_data('表C_總覽')
     df_Market = dm.load_live_data('Market')
-    firepower_mode = dm.load_firepower_mode()
+    firepower_mode = dm.load_firepower_mode(df_Monitor)
     firepower_profile = dm.get_firepower_profile(firepower_mode)
 
     st.header('1. 投資總覽')
+    show_snapshot_notice(dm.snapshot_time(live=True))
 
     # 準備總覽卡片數據
     tot_asset_str = "0"
@@ -223,25 +290,14 @@ def render_live_monitoring_fragment():
 
     target = 0
     gap = 0
+    sheet_pledge_status = ""
 
     if not df_C.empty:
-        df_c = df_C.copy()
-        first_col = df_c.columns[0]
-        df_c[first_col] = df_c[first_col].astype(str).str.strip()
-        df_c.set_index(first_col, inplace=True)
-        col_val = df_c.columns[0]
-
-        target = dm.safe_float(df_c.loc['短期財務目標', col_val]) if '短期財務目標' in df_c.index else 0
-        gap = dm.safe_float(df_c.loc['短期財務目標差距', col_val]) if '短期財務目標差距' in df_c.index else 0
-
-        # 達成進度主來源：
-        # 直接用「短期財務目標」與「短期財務目標差距」反推，
-        # 避免即時監控面板的舊百分比或公式封頂造成顯示 100%。
-        if target > 0:
-            current_for_goal = target - gap
-            pct_float = current_for_goal / target
-        else:
-            pct_float = 0.0
+        overview = dm.parse_overview(df_C)
+        target = overview['target']
+        gap = overview['gap']
+        pct_float = overview['pct']
+        sheet_pledge_status = overview['pledge_status']
 
     # 第一排卡片：總資產、現金、NAV淨變動、NAV波動率
     row1_col1, row1_col2, row1_col3, row1_col4 = st.columns(4)
@@ -269,21 +325,21 @@ def render_live_monitoring_fragment():
     st.markdown("<h3 style='margin-top: 0.5rem; margin-bottom: 0.5rem;'>📅 今日判斷 & 市場狀態</h3>", unsafe_allow_html=True)
 
     monitor_bottom_dict = {}
-    if not df_Monitor.empty:
-        for i, row in df_Monitor.iterrows():
-            if 'LDR' in row.values and '盤勢位置' in row.values:
-                headers = row.astype(str).str.strip().tolist()
-                if i + 1 < len(df_Monitor):
-                    values = df_Monitor.iloc[i + 1].tolist()
-                    monitor_bottom_dict = dict(zip(headers, values))
-                break
+    # 以 list 逐列掃描，避免 iterrows 每列都組一個 Series
+    monitor_rows = df_Monitor.values.tolist()
+    for i, row in enumerate(monitor_rows):
+        if 'LDR' in row and '盤勢位置' in row:
+            headers = [str(h).strip() for h in row]
+            if i + 1 < len(monitor_rows):
+                monitor_bottom_dict = dict(zip(headers, monitor_rows[i + 1]))
+            break
 
     if monitor_bottom_dict:
         try:
             ldr_raw = str(monitor_bottom_dict.get('LDR', 'N/A'))
             risk_today = str(monitor_bottom_dict.get('今日風險等級', 'N/A'))
             cmd = str(monitor_bottom_dict.get('今日指令', 'N/A'))
-            cmd = re.sub(r"【Debug.*?】", "", cmd, flags=re.DOTALL).strip()
+            cmd = dm.DEBUG_TAG_RE.sub("", cmd).strip()
             market_pos = str(monitor_bottom_dict.get('盤勢位置', 'N/A'))
 
             ldr_info = dm.classify_ldr_by_firepower(ldr_raw, firepower_mode)
@@ -311,26 +367,9 @@ def render_live_monitoring_fragment():
             raw_pledge = dm.safe_float(monitor_bottom_dict.get('總質押率', 0))
             pledge_val = raw_pledge * 100 if abs(raw_pledge) <= 5.0 else raw_pledge
 
-            sheet_pledge_status = ""
-            if not df_C.empty:
-                p_status_raw = dm.fuzzy_get(df_C.set_index(df_C.columns[0]), '質押率燈號')
-                if p_status_raw:
-                    sheet_pledge_status = str(p_status_raw).strip()
-
             if sheet_pledge_status:
                 p_status = sheet_pledge_status
-                if "安全" in p_status:
-                    p_color = "#009900"
-                elif "謹慎" in p_status:
-                    p_color = "#0EA5E9"
-                elif "高警戒" in p_status:
-                    p_color = "#EA580C"
-                elif "警戒" in p_status:
-                    p_color = "#F59E0B"
-                elif "危險" in p_status:
-                    p_color = "#FF0000"
-                else:
-                    p_color = "#334155"
+                p_color = status_color(p_status, PLEDGE_STATUS_COLORS)
             else:
                 if pledge_val < 30:
                     p_status, p_color = "安全（絕對安全區）", "#009900"
@@ -357,15 +396,7 @@ def render_live_monitoring_fragment():
                     if len(df_Market.columns) >= 4:
                         vix_status = str(vix_row.iloc[0].iloc[3]).strip()
 
-            risk_color = "#334155"
-            if "紅" in risk_today:
-                risk_color = "#FF0000"
-            elif "橘" in risk_today:
-                risk_color = "#EA580C"
-            elif "黃" in risk_today:
-                risk_color = "#F59E0B"
-            elif "綠" in risk_today:
-                risk_color = "#009900"
+            risk_color = status_color(risk_today, RISK_LEVEL_COLORS)
 
             m_cols = st.columns(7)
 
@@ -379,11 +410,11 @@ def render_live_monitoring_fragment():
                 st.markdown(vis.render_mini_metric("曝險倍數", e_display, e_color), unsafe_allow_html=True)
 
             with m_cols[3]:
-                match = re.search(r"(.+?)\s*([\(（].+?[\)）])", risk_today)
+                match = PAREN_NOTE_RE.search(risk_today)
                 if match:
                     r_main = match.group(1).strip()
                     r_sub = match.group(2).strip()
-                    r_sub_clean = re.sub(r"[（）\(\)]", "", r_sub)
+                    r_sub_clean = PAREN_CHARS_RE.sub("", r_sub)
                     risk_display_html = f"{r_main}<div style='font-size: 1rem; line-height: 1.0; margin-top: 2px; white-space: normal; word-break: break-word;'>{r_sub_clean}</div>"
                 else:
                     risk_display_html = risk_today
@@ -402,11 +433,11 @@ def render_live_monitoring_fragment():
 
             with m_cols[6]:
                 v_html = vix_status
-                match = re.search(r"(.+?)\s*([\(（].+?[\)）])", vix_status, re.DOTALL)
+                match = PAREN_NOTE_MULTILINE_RE.search(vix_status)
                 if match:
                     v_main = match.group(1).strip()
                     v_sub = match.group(2).strip()
-                    v_sub_clean = re.sub(r"[（）\(\)]", "", v_sub).replace('\n', ' ')
+                    v_sub_clean = PAREN_CHARS_RE.sub("", v_sub).replace('\n', ' ')
                     v_html = f"{v_main}<div style='font-size: 1rem; line-height: 1.3; margin-top: 2px; white-space: normal; color: gray;'>{v_sub_clean}</div>"
                 vix_display_html = f"{vix_val}<div style='font-size: 1rem; line-height: 1.2; margin-top: 2px;'>{v_html}</div>"
                 st.markdown(vis.render_mini_metric("VIX", vix_display_html), unsafe_allow_html=True)
@@ -425,12 +456,11 @@ def render_live_monitoring_fragment():
             )
 
             mindset_text = ""
-            for i, row in df_Monitor.iterrows():
-                if '心態短句' in row.values or '提醒' in row.values:
-                    headers = row.astype(str).str.strip().tolist()
-                    if i + 1 < len(df_Monitor):
-                        values = df_Monitor.iloc[i + 1].tolist()
-                        m_dict = dict(zip(headers, values))
+            for i, row in enumerate(monitor_rows):
+                if '心態短句' in row or '提醒' in row:
+                    headers = [str(h).strip() for h in row]
+                    if i + 1 < len(monitor_rows):
+                        m_dict = dict(zip(headers, monitor_rows[i + 1]))
                         mindset_col = next((c for c in m_dict.keys() if '心態' in str(c) or '提醒' in str(c)), None)
                         if mindset_col:
                             mindset_text = str(m_dict.get(mindset_col, '')).strip()
@@ -470,25 +500,8 @@ c1, c2 = st.columns([3, 1])
 with c1:
     st.markdown("### 📝 持股明細") 
     if not df_A.empty:
-        df_show = df_A.copy()
-        
-        # --- 戰術淨化：過濾空白行與未持有標的 ---
-        # 1. 濾除沒有股票代碼的空白行
-        df_show = df_show[df_show['股票'].astype(str).str.strip() != '']
-        df_show = df_show[df_show['股票'].astype(str).str.strip().str.lower() != 'nan']
-        # 2. 只保留持有數量大於 0 的實際部位
-        if '持有數量（股）' in df_show.columns:
-            df_show = df_show[df_show['持有數量（股）'].apply(dm.safe_float) > 0]
-        # ----------------------------------------
-
-        if st.session_state['live_prices']:
-            df_show['即時價'] = df_show['股票'].map(st.session_state['live_prices']).fillna('')
-        
-        for c in ['持有數量（股）', '市值（元）', '浮動損益']: 
-            if c in df_show.columns: df_show[c] = df_show[c].apply(dm.fmt_int)
-        for c in ['平均成本', '收盤價', '即時價']:
-            if c in df_show.columns: df_show[c] = df_show[c].apply(dm.fmt_money)
-            
+        df_show = dm.build_holdings_view(df_A, st.session_state['live_prices'])
+
         height_val = (len(df_show) + 1) * 35 + 20
 
         st.dataframe(
@@ -496,6 +509,7 @@ with c1:
             use_container_width=True,
             height=height_val,
             hide_index=True,
+            column_config=number_columns(dm.HOLDINGS_MONEY_COLS, dm.HOLDINGS_INT_COLS),
         )
 
 with c2:
@@ -512,68 +526,97 @@ diag("06 holdings render complete")
 # ==========================================
 diag("07 transactions and NAV render start")
 st.header('3. 交易紀錄與淨值')
-t1, t2, t3 = st.tabs(['現金流', '已實現損益', '每日淨值'])
 
-with t1:
+# 篩選、分頁等互動只重跑所在分頁的 fragment，不必重跑整頁
+@st.fragment
+def render_cash_flow_fragment():
+    df_D = dm.load_data('表D_現金流')
     if not df_D.empty:
-        df_calc = df_D.copy()
-        if '日期' in df_calc.columns:
-            df_calc['dt'] = pd.to_datetime(df_calc['日期'], errors='coerce')
-            df_calc.sort_values('dt', ascending=False, inplace=True)
+        # load_data 每次都回傳快取的獨立副本，可直接加欄位，不必再 copy；讀取時已依日期由新到舊排好
+        df_calc = df_D
+        if '日期' in df_calc.columns: df_calc['dt'] = dm.dates(df_calc, '日期')
         cats = df_calc['動作'].unique().tolist()
         sel = st.multiselect('篩選動作', cats, default=cats)
+        total = dm.group_sums(df_calc, '動作', '淨收／支出').reindex(sel).sum() if '淨收／支出' in df_calc.columns else 0
         df_calc = df_calc[df_calc['動作'].isin(sel)]
-        total = df_calc['淨收／支出'].apply(dm.safe_float).sum() if '淨收／支出' in df_calc.columns else 0
         c_a, c_b = st.columns(2)
         c_a.metric("篩選淨額", dm.fmt_money(total))
         c_b.markdown(f"**筆數：** {len(df_calc)}")
-        df_view = df_calc.drop(columns=['dt'], errors='ignore').copy()
-        if '日期' in df_view.columns: df_view['日期'] = df_view['日期'].apply(dm.fmt_date)
-        for c in ['淨收／支出', '累積現金', '成交價']:
-            if c in df_view.columns: df_view[c] = df_view[c].apply(dm.fmt_money)
-        if '數量' in df_view.columns: df_view['數量'] = df_view['數量'].apply(dm.fmt_int)
-        st.dataframe(df_view, use_container_width=True, height=400)
+        df_page = paginate_frame(df_calc, 'cash_page')
+        df_view = dm.without_helper_columns(df_page)
+        if '日期' in df_view.columns: df_view['日期'] = dm.fmt_date_series(df_page, '日期')
+        # 數值欄在讀取時已轉好 (_num)，這裡直接換上 float 欄，千分位交給前端 column_config
+        for c in dm.NUMERIC_COLUMNS['表D_現金流']:
+            if c in df_view.columns: df_view[c] = dm.numeric(df_page, c)
+        st.dataframe(
+            df_view,
+            use_container_width=True,
+            height=400,
+            column_config=number_columns(['淨收／支出', '累積現金', '成交價'], ['數量']),
+        )
         if not df_calc.empty: st.caption(f"📅 {df_calc['dt'].min().date()} ~ {df_calc['dt'].max().date()}")
 
-with t2:
+
+@st.fragment
+def render_realized_pnl_fragment():
+    df_E = dm.load_data('表E_已實現損益')
     if not df_E.empty:
-        df_calc = df_E.copy()
+        df_calc = df_E
         d_col = next((c for c in df_calc.columns if '日期' in c), None)
-        if d_col:
-            df_calc['dt'] = pd.to_datetime(df_calc[d_col], errors='coerce')
-            df_calc.sort_values('dt', ascending=False, inplace=True)
+        if d_col: df_calc['dt'] = dm.dates(df_calc, d_col)
         stocks = df_calc['股票'].unique().tolist()
         c_sel, c_all, c_clr = st.columns([4, 1, 1])
         with c_sel: sel_s = st.multiselect('篩選股票', stocks, default=stocks, key='pnl_s', label_visibility="collapsed")
+        # 全選 / 清除以 on_click 在重跑前改寫 pnl_s：widget 建立後就不能再直接指定其 session_state
         with c_all:
             st.markdown('<div style="height: 28px"></div>', unsafe_allow_html=True)
-            if st.button("全選"): del st.session_state['pnl_s']; st.rerun()
+            st.button("全選", on_click=lambda: st.session_state.pop('pnl_s', None))
         with c_clr:
             st.markdown('<div style="height: 28px"></div>', unsafe_allow_html=True)
-            if st.button("清除"): st.session_state['pnl_s'] = []; st.rerun()
+            st.button("清除", on_click=lambda: st.session_state.update(pnl_s=[]))
+        if '已實現損益' in df_calc.columns:
+            sums = dm.group_sums(df_calc, '股票', '已實現損益')
+            total = sums.reindex(sel_s).sum() if sel_s else sums.sum()
+        else:
+            total = 0
         if sel_s: df_calc = df_calc[df_calc['股票'].isin(sel_s)]
-        total = df_calc['已實現損益'].apply(dm.safe_float).sum() if '已實現損益' in df_calc.columns else 0
         st.metric("總實現損益", dm.fmt_money(total))
-        df_view = df_calc.drop(columns=['dt'], errors='ignore').copy()
-        if d_col: df_view[d_col] = df_view[d_col].apply(dm.fmt_date)
-        for c in ['已實現損益', '投資成本', '帳面收入', '成交均價']:
-             if c in df_view.columns: df_view[c] = df_view[c].apply(dm.fmt_money)
-        st.dataframe(df_view, use_container_width=True, height=400)
+        df_page = paginate_frame(df_calc, 'pnl_page')
+        df_view = dm.without_helper_columns(df_page)
+        if d_col: df_view[d_col] = dm.fmt_date_series(df_page, d_col)
+        pnl_cols = dm.NUMERIC_COLUMNS['表E_已實現損益']
+        for c in pnl_cols:
+             if c in df_view.columns: df_view[c] = dm.numeric(df_page, c)
+        st.dataframe(df_view, use_container_width=True, height=400, column_config=number_columns(pnl_cols))
+
+
+t1, t2, t3 = st.tabs(['現金流', '已實現損益', '每日淨值'])
+
+with t1:
+    render_cash_flow_fragment()
+
+with t2:
+    render_realized_pnl_fragment()
 
 with t3:
+    df_F = dm.load_data('表F_每日淨值')
     fig = vis.plot_nav_trend(df_F)
     if fig:
         st.plotly_chart(fig, use_container_width=True)
+        mdd = dm.nav_max_drawdown(df_F)
+        if mdd is not None: st.metric("最大回撤", f"{mdd*100:.2f}%")
         with st.expander("詳細數據"):
-            df_calc = df_F.copy()
-            d_col = next((c for c in df_calc.columns if '日期' in c), '日期')
-            df_calc['dt'] = pd.to_datetime(df_calc[d_col], errors='coerce')
-            df_disp = df_calc.sort_values('dt', ascending=False).drop(columns=['dt'], errors='ignore').copy()
-            df_disp['日期'] = df_disp['日期'].apply(dm.fmt_date)
-            for c in ['實質NAV', '股票市值', '現金']:
-                if c in df_disp.columns: df_disp[c] = df_disp[c].apply(dm.fmt_money)
-            st.dataframe(df_disp, use_container_width=True)
-            if not df_calc.empty: st.caption(f"📅 紀錄: {df_calc['dt'].min().date()} ~ {df_calc['dt'].max().date()}")
+            # df_F 之後還要交給財富路徑圖 (以內容作快取鍵)，日期序列另外存放，不在原表上加欄位
+            d_col = next((c for c in df_F.columns if '日期' in c), '日期')
+            dt = dm.dates(df_F, d_col)
+            # 排序與挑選顯示欄位一次 reindex 完成；格式化結果依索引對齊寫回
+            df_disp = df_F.reindex(index=dt.sort_values(ascending=False).index, columns=dm.display_columns(df_F))
+            df_disp['日期'] = dm.fmt_date_series(df_F, '日期')
+            nav_cols = dm.NUMERIC_COLUMNS['表F_每日淨值']
+            for c in nav_cols:
+                if c in df_disp.columns: df_disp[c] = dm.numeric(df_F, c)
+            st.dataframe(df_disp, use_container_width=True, column_config=number_columns(nav_cols))
+            if not df_F.empty: st.caption(f"📅 紀錄: {dt.min().date()} ~ {dt.max().date()}")
 
 st.markdown('---')
 diag("08 transactions and NAV render complete")
@@ -584,70 +627,23 @@ diag("09 wealth blueprint render start")
 # 4. 財富藍圖 (靜態區)
 # ==========================================
 st.header('4. 財富藍圖')
+df_G = dm.load_data('表G_財富藍圖')
 if not df_G.empty:
     try:
-        all_rows = [df_G.columns.tolist()] + df_G.values.tolist()
-        current_title = None
-        current_data = []
-        found_sections = False 
-        
-        for row in all_rows:
-            first_cell = str(row[0]).strip()
-            if first_cell.startswith(('一、', '二、', '三、', '四、', '五、')):
-                found_sections = True
-                if current_title:
-                    title_match = re.search(r"(.+?)\s*[（\(](.+)[）\)]", current_title)
-                    if title_match:
-                        main_t = title_match.group(1).strip()
-                        sub_t = title_match.group(2).strip()
-                        st.markdown(f"### {main_t}")
-                        st.markdown(f"<div style='font-size: 0.9em; color: gray; margin-top: -0.5rem; margin-bottom: 0.8rem;'>（{sub_t}）</div>", unsafe_allow_html=True)
-                    else:
-                        st.subheader(current_title)
-                        
-                    if len(current_data) > 0:
-                        headers = current_data[0]
-                        body = current_data[1:] if len(current_data) > 1 else []
-                        u_heads = []
-                        seen = {}
-                        for h in headers:
-                            h_str = str(h).strip()
-                            if not h_str: h_str = "-" 
-                            if h_str in seen: seen[h_str] += 1; u_heads.append(f"{h_str}_{seen[h_str]}")
-                            else: seen[h_str] = 0; u_heads.append(h_str)
-                        if body:
-                            st.dataframe(pd.DataFrame(body, columns=u_heads), use_container_width=True, hide_index=True)
-                current_title = first_cell
-                current_data = []
-            elif any(str(c).strip() for c in row):
-                if current_title is not None:
-                    current_data.append(row)
-        
-        # Render last
-        if current_title:
-            title_match = re.search(r"(.+?)\s*[（\(](.+)[）\)]", current_title)
+        sections = dm.parse_blueprint_sections(df_G)
+        for title, table in sections:
+            title_match = SECTION_TITLE_RE.search(title)
             if title_match:
                 main_t = title_match.group(1).strip()
                 sub_t = title_match.group(2).strip()
                 st.markdown(f"### {main_t}")
                 st.markdown(f"<div style='font-size: 0.9em; color: gray; margin-top: -0.5rem; margin-bottom: 0.8rem;'>（{sub_t}）</div>", unsafe_allow_html=True)
             else:
-                st.subheader(current_title)
-            
-            if len(current_data) > 0:
-                headers = current_data[0]
-                body = current_data[1:] if len(current_data) > 1 else []
-                u_heads = []
-                seen = {}
-                for h in headers:
-                    h_str = str(h).strip()
-                    if not h_str: h_str = "-" 
-                    if h_str in seen: seen[h_str] += 1; u_heads.append(f"{h_str}_{seen[h_str]}")
-                    else: seen[h_str] = 0; u_heads.append(h_str)
-                if body:
-                    st.dataframe(pd.DataFrame(body, columns=u_heads), use_container_width=True, hide_index=True)
-        
-        if not found_sections:
+                st.subheader(title)
+            if table is not None:
+                st.dataframe(table, use_container_width=True, hide_index=True)
+
+        if not sections:
             st.dataframe(df_G, use_container_width=True)
 
     except:
@@ -3,24 +3,50 @@ import pandas as pd
 import numpy as np
 import gspread
 import time
+import os
+import pickle
+import tempfile
 import re
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
+# Copy-on-Write：篩選、drop、reindex 等不再預先複製資料，只有真的寫入時才複製；
+# 快取回傳的 DataFrame 也因此不會被下游的欄位指派就地改動
+pd.set_option('mode.copy_on_write', True)
+
 # ==============================================================================
 # ⚙️ 設定區
 SHEET_URL = "https://docs.google.com/spreadsheets/d/1_JBI1pKWv9aw8dGCj89y9yNgoWG4YKllSMnPLpU_CCM/edit"
 # ==============================================================================
 
+# 今日指令中的【Debug…】註記 (可跨行)，顯示與日報前移除
+DEBUG_TAG_RE = re.compile(r"【Debug.*?】", re.DOTALL)
+_MULTI_SPACE_RE = re.compile(" +")
+
 # --- 核心工具函式 ---
+ARROW_STRING = 'string[pyarrow]'
+# 數值清洗對照表：一次 translate 完成去符號、萬→0000、括號負數
+_NUMERIC_CLEAN_TABLE = str.maketrans({',': None, '$': None, '¥': None, '%': None, '萬': '0000', '(': '-', ')': None})
+# safe_numeric 用：對照表中「刪除」的字元合併成一個 regex 字元類
+_NUMERIC_STRIP_PATTERN = r'[,$¥%)]'
+
 def safe_float(value):
     if pd.isna(value) or value == '' or value is None: return 0.0
     try:
-        s = str(value).strip()
-        s = s.replace(',', '').replace('$', '').replace('¥', '').replace('%', '')
-        s = s.replace('萬', '0000').replace('(', '-').replace(')', '')
-        return float(s)
+        return float(str(value).strip().translate(_NUMERIC_CLEAN_TABLE))
     except: return 0.0
 
+def safe_numeric(series):
+    """safe_float 的整欄向量化版本，供加總、篩選等大量運算使用"""
+    if pd.api.types.is_numeric_dtype(series): return series.astype(float).fillna(0.0)
+    s = series.astype(ARROW_STRING).str.strip()
+    # 與 _NUMERIC_CLEAN_TABLE 相同的字元對應：要刪除的符號合併成一次 regex，只剩 萬、( 兩個替換
+    s = s.str.replace(_NUMERIC_STRIP_PATTERN, '', regex=True)
+    s = s.str.replace('萬', '0000', regex=False).str.replace('(', '-', regex=False)
+    return pd.to_numeric(s, errors='coerce').fillna(0.0).astype(float)
+
 FIREPOWER_MODES = {
     "System10": {
         "target_range": "45–50%",
@@ -129,133 +155,601 @@ def find_report_col(df, candidates):
     return None
 
 # --- 連線與資料讀取 ---
+GSHEET_CLIENT_TTL = 3600
+
+@st.cache_resource(show_spinner=False, ttl=GSHEET_CLIENT_TTL)
+def _open_gsheet():
+    """建立 gspread client 並開啟試算表，整個行程共用一份；失敗時拋出例外，不會被快取。
+    每小時重建一次，連線或憑證失效時不必重啟服務"""
+    secrets = dict(st.secrets["connections"]["gsheets"])
+    if "private_key" in secrets:
+        secrets["private_key"] = secrets["private_key"].replace('\\n', '\n')
+
+    gc = gspread.service_account_from_dict(secrets)
+    sh = gc.open_by_url(SHEET_URL)
+    return gc, sh
+
 def get_gsheet_connection():
     try:
         if "connections" not in st.secrets or "gsheets" not in st.secrets["connections"]:
             st.error("❌ Secrets 設定錯誤：找不到 [connections.gsheets]。請檢查 .streamlit/secrets.toml")
             return None, None
-            
-        secrets = dict(st.secrets["connections"]["gsheets"])
-        if "private_key" in secrets:
-            secrets["private_key"] = secrets["private_key"].replace('\\n', '\n')
-            
-        gc = gspread.service_account_from_dict(secrets)
-        sh = gc.open_by_url(SHEET_URL)
-        return gc, sh
+
+        return _open_gsheet()
     except Exception as e:
         st.error(f"❌ 連線錯誤: {e}")
         return None, None
 
-def _load_sheet_data(sheet_name):
+# 一般資料與高頻監控資料各自整批讀取 (一次 values_batch_get)，快取週期不同
+DATA_SHEETS = ('表A_持股總表', '表B_持股比例', '表D_現金流', '表E_已實現損益', '表F_每日淨值', '表G_財富藍圖')
+LIVE_SHEETS = ('表C_總覽', '即時監控面板', 'Market')
+
+def _dedup_columns(headers, blank):
+    """空白欄名補成 blank，重複者依出現順序加上 _1、_2…；以 groupby.cumcount 取代逐欄迴圈"""
+    cols = pd.Series(headers, dtype=object).replace('', blank)
+    n = cols.groupby(cols).cumcount()
+    return cols.where(n == 0, cols + '_' + n.astype(str)).tolist()
+
+def _frame_from_values(data):
+    if not data: return pd.DataFrame()
+
+    headers = [str(h).strip() for h in data[0]]
+    # 處理重複欄位名稱
+    if len(headers) != len(set(headers)):
+        headers = _dedup_columns(headers, "Unnamed")
+    # 以 Arrow 字串欄儲存：記憶體較省，.str 系列操作走 Arrow 核心而非 Python 物件迴圈
+    return pd.DataFrame(data[1:], columns=headers, dtype=ARROW_STRING)
+
+def _load_sheet_data(sh, sheet_name):
+    """逐張讀取單一工作表 (不呼叫任何 st.*，可在背景執行緒中執行)；失敗重試 3 次"""
     max_retries = 3
     for attempt in range(max_retries):
-        with st.spinner(f"讀取: {sheet_name}..."):
+        try:
             try:
-                gc, sh = get_gsheet_connection() 
-                if not sh: return pd.DataFrame()
-                
-                try:
-                    ws = sh.worksheet(sheet_name) 
-                    data = ws.get_all_values()
-                except gspread.exceptions.WorksheetNotFound:
-                    return pd.DataFrame()
-                    
-                if not data: return pd.DataFrame()
-                
-                headers = [str(h).strip() for h in data[0]]
-                df = pd.DataFrame(data[1:], columns=headers)
-                
-                # 處理重複欄位名稱
-                if len(df.columns) != len(set(df.columns)):
-                    cols = []
-                    count = {}
-                    for c in df.columns:
-                        n = "Unnamed" if not c else c
-                        if n in count: count[n]+=1; cols.append(f"{n}_{count[n]}")
-                        else: count[n]=0; cols.append(n)
-                    df.columns = cols
-                return df
-                
-            except Exception as e:
-                time.sleep(2)
+                data = sh.worksheet(sheet_name).get_all_values()
+            except gspread.exceptions.WorksheetNotFound:
+                return pd.DataFrame()
+
+            return _frame_from_values(data)
+
+        except Exception as e:
+            time.sleep(2)
     return pd.DataFrame()
 
-# 一般資料：維持較低頻快取
-@st.cache_data(ttl=60)
+def _fetch_sheets(sh, sheet_names):
+    """以一次 values_batch_get 讀回多張工作表；若有工作表不存在 (整批回 400)，改為各表並行逐張讀取。
+    不呼叫任何 st.*，可在背景執行緒中執行"""
+    max_retries = 3
+    for attempt in range(max_retries):
+        try:
+            res = sh.values_batch_get([gspread.utils.absolute_range_name(name) for name in sheet_names])
+            value_ranges = res.get('valueRanges', [])
+            # API 會省略列尾空白儲存格，補齊成矩形以對齊 get_all_values 的結果
+            return {
+                name: _frame_from_values(gspread.utils.fill_gaps(vr['values']) if vr.get('values') else [])
+                for name, vr in zip(sheet_names, value_ranges)
+            }
+        except gspread.exceptions.APIError as e:
+            if e.response.status_code == 400: break
+            time.sleep(2)
+        except Exception as e:
+            time.sleep(2)
+    else:
+        return {name: pd.DataFrame() for name in sheet_names}
+    # 逐張讀取時各表並行請求，總延遲約為最慢的一張，而非各張相加
+    with ThreadPoolExecutor(max_workers=len(sheet_names)) as ex:
+        return dict(zip(sheet_names, ex.map(lambda name: _load_sheet_data(sh, name), sheet_names)))
+
+def _load_sheets(sheet_names):
+    with st.spinner(f"讀取: {'、'.join(sheet_names)}..."):
+        gc, sh = get_gsheet_connection()
+        if not sh: return {name: pd.DataFrame() for name in sheet_names}
+        return _fetch_sheets(sh, sheet_names)
+
+# 讀取時先轉好的數值欄 (附加為「欄名_num」)，下游加總、篩選、格式化直接取用，不必每次重跑再清理字串
+NUMERIC_COLUMNS = {
+    '表A_持股總表': ('持有數量（股）', '市值（元）', '浮動損益', '平均成本', '收盤價'),
+    '表B_持股比例': ('市值（元）',),
+    '表D_現金流': ('淨收／支出', '累積現金', '成交價', '數量'),
+    '表E_已實現損益': ('已實現損益', '投資成本', '帳面收入', '成交均價'),
+    '表F_每日淨值': ('實質NAV', '股票市值', '現金'),
+}
+NUM_SUFFIX = '_num'
+
+def numeric(df, col):
+    """取欄位數值：有讀取時轉好的 _num 欄就直接用，否則現場以 safe_numeric 轉換；一律以 float64 回傳供加總"""
+    num_col = col + NUM_SUFFIX
+    return df[num_col].astype('float64') if num_col in df.columns else safe_numeric(df[col])
+
+# 分頁篩選用的低基數欄位，讀取時轉成 category：篩選選項與 isin 都只比對類別代碼
+CATEGORY_COLUMNS = {
+    '表D_現金流': ('動作',),
+    '表E_已實現損益': ('股票',),
+}
+
+# 表B 中的合計列 (不是個別持股)；讀取時標記為「股票_total」，圓餅圖直接取用不必每次重比字串
+TOTAL_ROW_LABELS = {'總資產', 'Total', 'Total資產'}
+TOTAL_SUFFIX = '_total'
+
+def total_rows(df, col='股票'):
+    """合計列遮罩：有讀取時標好的 _total 欄就直接用，否則現場比對"""
+    flag_col = col + TOTAL_SUFFIX
+    return df[flag_col] if flag_col in df.columns else df[col].astype(ARROW_STRING).str.strip().isin(TOTAL_ROW_LABELS)
+
+# 讀取時即依第一個日期欄由新到舊排序的表
+DATE_SORTED_SHEETS = ('表D_現金流', '表E_已實現損益')
+
+# 含「日期」的欄位在讀取時一併解析 (附加為「欄名_dt」)，各分頁與圖表不必各自再跑 pd.to_datetime
+DATE_SUFFIX = '_dt'
+
+def dates(df, col):
+    """取欄位日期：有讀取時解析好的 _dt 欄就直接用，否則現場以 pd.to_datetime 解析"""
+    dt_col = col + DATE_SUFFIX
+    return df[dt_col] if dt_col in df.columns else pd.to_datetime(df[col], errors='coerce')
+
+def fmt_date_series(df, col):
+    """fmt_date 的整欄版本：以解析好的日期格式化，無法解析者保留原字串"""
+    return dates(df, col).dt.strftime('%Y-%m-%d').fillna(df[col].astype(str))
+
+def display_columns(df):
+    """表格要顯示的欄位：排除 dt 排序欄與 _num、_dt、_total 輔助欄"""
+    return [c for c in df.columns if c != 'dt' and not str(c).endswith((NUM_SUFFIX, DATE_SUFFIX, TOTAL_SUFFIX))]
+
+def without_helper_columns(df):
+    """移除輔助欄，供表格顯示；一次 drop 完成，不另外 copy"""
+    keep = set(display_columns(df))
+    return df.drop(columns=[c for c in df.columns if c not in keep])
+
+# --- 磁碟快照 ---
+# st.cache_data(persist="disk") 會忽略 ttl (資料永不過期)，故自行以檔案修改時間判斷新舊；
+# 行程重啟後先讀快照顯示，不必等 Sheets API，過期的再於背景更新
+# 一般資料 5 分鐘內直接取快取；表格手動更新後可按側欄「重新載入」立即失效
+DATA_TTL = 300
+LIVE_TTL = 20
+SNAPSHOT_DIR = os.path.join('.streamlit', 'cache', 'sheets')
+# 一般資料的背景更新先比對 modifiedTime；公式 (如 GOOGLEFINANCE) 重算不會改動 modifiedTime，故最久每 30 分鐘仍完整讀取一次
+FULL_REFRESH_AGE = 30 * 60
+# 冷啟動時可先顯示的快照最長年齡；更舊的快照視同不存在，改為同步讀取。
+# 高頻監控資料每 LIVE_TTL 秒就該更新，只接受一分鐘內的快照，否則重啟後會顯示 (並寫入日報) 數小時前的監控數據
+SNAPSHOT_MAX_AGE = 12 * 3600
+LIVE_SNAPSHOT_MAX_AGE = 3 * LIVE_TTL
+
+def _snapshot_path(key):
+    return os.path.join(SNAPSHOT_DIR, f"{key}.pkl")
+
+def _read_snapshot(key, max_age):
+    """回傳 (資料, 快照時間)；不存在或超過 max_age 秒時回傳 None"""
+    path = _snapshot_path(key)
+    try:
+        mtime = os.path.getmtime(path)
+        if time.time() - mtime > max_age: return None
+        with open(path, 'rb') as f: return pickle.load(f), mtime
+    except Exception: return None
+
+def _write_snapshot(key, data):
+    # 先寫暫存檔再 os.replace，其他 session 不會讀到寫一半的檔案
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=SNAPSHOT_DIR)
+        with os.fdopen(fd, 'wb') as f: pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, _snapshot_path(key))
+    except Exception: pass
+
+def _clear_snapshot(key):
+    try: os.remove(_snapshot_path(key))
+    except OSError: pass
+
+def _compact_float(s):
+    """float32 轉回 float64 與原值完全相同時才以 float32 儲存 (快取與磁碟快照的數值欄減半)，否則保留 float64；
+    不用 pd.to_numeric(downcast='float')：它容許 5e-4 的誤差，1234.56 會變成 1234.56005859375，加總後出現偏差"""
+    s32 = s.astype('float32')
+    return s32 if np.array_equal(s32.to_numpy('float64'), s.to_numpy('float64'), equal_nan=True) else s
+
+def _prepare_data_sheets(sheets):
+    """一般資料讀回後的前處理：數值、日期、分類欄與排序一次做好，快取與快照都存處理後的結果"""
+    for name, df in sheets.items():
+        for c in NUMERIC_COLUMNS.get(name, ()):
+            if c in df.columns: df[c + NUM_SUFFIX] = _compact_float(safe_numeric(df[c]))
+        for c in [c for c in df.columns if '日期' in str(c)]:
+            df[c + DATE_SUFFIX] = pd.to_datetime(df[c], errors='coerce')
+        for c in CATEGORY_COLUMNS.get(name, ()):
+            if c in df.columns: df[c] = df[c].astype('category')
+        if name == '表B_持股比例' and '股票' in df.columns: df['股票' + TOTAL_SUFFIX] = total_rows(df)
+        # 交易紀錄分頁固定以新到舊顯示：讀取時排好一次，分頁重跑不必再排序
+        d_col = find_col(df.columns, '日期') if name in DATE_SORTED_SHEETS else None
+        if d_col: df.sort_values(d_col + DATE_SUFFIX, ascending=False, inplace=True)
+    return sheets
+
+class _SheetStore:
+    """整批工作表的行程層級快取 (stale-while-revalidate)：
+    超過 ttl 時先回傳舊資料，同時由背景執行緒重新讀取 (每個行程同一時間只有一條)，使用者不必等 Sheets API"""
+
+    def __init__(self, key, sheet_names, ttl, prepare=None, check_modified=False, snapshot_max_age=SNAPSHOT_MAX_AGE):
+        self.key, self.sheet_names, self.ttl, self.prepare = key, sheet_names, ttl, prepare
+        self.value, self.fetched_at, self.version = None, 0.0, 0
+        # snapshot_at：目前提供的是磁碟快照時為其寫入時間，換成 Sheets 讀回的資料後為 None
+        self.snapshot_max_age, self.snapshot_at = snapshot_max_age, None
+        # check_modified：背景更新前先問 Drive 的 modifiedTime，未變動就沿用手上的資料
+        self.check_modified, self.modified, self.full_at = check_modified, None, 0.0
+        # generation：每次 invalidate 加一；背景更新開始時記下，結束時若已被 invalidate 就丟棄結果
+        self.generation = 0
+        # RLock：冷啟動路徑持鎖呼叫 _store，_store 內仍需取鎖以免與 invalidate 交錯
+        self._lock = threading.RLock()
+        self._refreshing = False
+
+    def _store(self, sheets, generation=None):
+        """存入新讀回的資料；generation 與目前不符 (讀取期間已被 invalidate) 時丟棄，不覆蓋記憶體與快照。
+        回傳是否為一次完整的讀取 (有資料、未被丟棄、也沒有任何一張表沿用舊資料)"""
+        if self.prepare: self.prepare(sheets)
+        ok = any(not df.empty for df in sheets.values())
+        with self._lock:
+            if generation is not None and generation != self.generation: return False
+            # 逐張合併：單張讀取失敗 (回傳空表) 時保留該表手上的舊資料，不讓空表蓋掉記憶體與快照
+            old = self.value or {}
+            kept = {name for name, df in sheets.items() if df.empty and name in old and not old[name].empty}
+            merged = {name: old[name] if name in kept else df for name, df in sheets.items()}
+            # 讀取全數失敗時不寫快照、也不覆蓋手上的舊資料，只延後下一次重試
+            if ok: _write_snapshot(self.key, merged)
+            if ok or self.value is None:
+                self.value = merged
+                self.version += 1
+            if ok: self.snapshot_at = None
+            self.fetched_at = time.time()
+        return ok and not kept
+
+    def _modified_time(self, sh):
+        """Drive 的 modifiedTime；查詢失敗回傳 None (一律視為有變動)"""
+        try: return sh.get_lastUpdateTime()
+        except Exception: return None
+
+    def _refresh(self, sh, generation):
+        try:
+            modified = self._modified_time(sh) if self.check_modified else None
+            # 試算表自上次完整讀取後未被編輯 (且未超過 FULL_REFRESH_AGE) 時沿用手上的資料
+            if modified is not None and modified == self.modified and time.time() - self.full_at < FULL_REFRESH_AGE:
+                with self._lock:
+                    if generation == self.generation: self.fetched_at = time.time()
+                return
+            # 新的 modifiedTime 只在完整讀回且未被丟棄後才記下；讀取失敗時下一輪仍會重讀，不會把編輯藏到 FULL_REFRESH_AGE 之後
+            if self._store(_fetch_sheets(sh, self.sheet_names), generation):
+                with self._lock:
+                    if generation == self.generation: self.full_at, self.modified = time.time(), modified
+        except Exception:
+            with self._lock:
+                if generation == self.generation: self.fetched_at = time.time()
+        finally: self._refreshing = False
+
+    def get(self):
+        if self.value is None:
+            with self._lock:
+                if self.value is None:
+                    # 行程重啟後先用磁碟快照秒開 (即使已過 ttl)，過期的部分交給下方的背景更新補上
+                    sheets = _read_snapshot(self.key, self.snapshot_max_age)
+                    if sheets is not None:
+                        self.value, self.fetched_at = sheets
+                        self.snapshot_at = self.fetched_at
+                        self.version += 1
+                    else:
+                        self._store(_load_sheets(self.sheet_names))
+        if time.time() - self.fetched_at >= self.ttl and not self._refreshing:
+            # 連線在主執行緒取得 (需讀 st.secrets)；背景執行緒只發 HTTP 請求
+            _, sh = get_gsheet_connection()
+            with self._lock:
+                if sh and not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh, args=(sh, self.generation), daemon=True).start()
+        return self.value
+
+    def invalidate(self):
+        with self._lock:
+            self.value, self.fetched_at, self.modified, self.snapshot_at = None, 0.0, None, None
+            self.version += 1
+            self.generation += 1
+
+# 一般資料 (表A…表G) 與高頻監控資料 (用於 fragment 局部刷新) 各一份
+@st.cache_resource(show_spinner=False)
+def _sheet_store(key):
+    if key == 'live': return _SheetStore('live', LIVE_SHEETS, LIVE_TTL, snapshot_max_age=LIVE_SNAPSHOT_MAX_AGE)
+    return _SheetStore('data', DATA_SHEETS, DATA_TTL, _prepare_data_sheets, check_modified=True)
+
+def clear_sheet_cache(live=True):
+    """清除一般資料 (live=True 時連同高頻監控資料) 的記憶體快取與磁碟快照；下一次取用會重新讀取"""
+    for key in (('data', 'live') if live else ('data',)):
+        _sheet_store(key).invalidate()
+        _clear_snapshot(key)
+
+def snapshot_time(live=False):
+    """目前顯示的一般資料 (live=True 時為高頻監控資料) 若來自磁碟快照，回傳快照時間 (epoch 秒)；否則回傳 None"""
+    return _sheet_store('live' if live else 'data').snapshot_at
+
+# 行程層級的資料為共用物件；逐表經 cache_data 複製一份 (以版本號為鍵)，呼叫端可直接加欄位、排序，
+# 且各區塊只反序列化自己用到的那張表
+@st.cache_data(show_spinner=False, max_entries=64)
+def _sheet_copy(key, sheet_name, version):
+    sheets = _sheet_store(key).value
+    return (sheets if sheets is not None else _sheet_store(key).get())[sheet_name]
+
 def load_data(sheet_name):
-    return _load_sheet_data(sheet_name)
+    store = _sheet_store('data')
+    store.get()
+    return _sheet_copy('data', sheet_name, store.version)
 
-# 高頻監控資料：用於 fragment 局部刷新
-@st.cache_data(ttl=20)
 def load_live_data(sheet_name):
-    return _load_sheet_data(sheet_name)
+    store = _sheet_store('live')
+    store.get()
+    return _sheet_copy('live', sheet_name, store.version)
 
-@st.cache_data(ttl=20)
-def load_firepower_mode():
-    try:
-        _, sh = get_gsheet_connection()
-        if not sh:
-            return "System10"
-        ws = sh.worksheet("即時監控面板")
-        return normalize_firepower_mode(ws.acell("AB10").value)
-    except Exception:
-        return "System10"
+def load_firepower_mode(df_Monitor=None):
+    """火力模式位於即時監控面板 AB10；該表已隨高頻監控資料整批讀回，直接取位置，不再另發 acell 請求。
+    呼叫端手上已有該表時可直接傳入，省去再複製一份"""
+    df = load_live_data('即時監控面板') if df_Monitor is None else df_Monitor
+    # 第 1 列為表頭，故 AB10 對應資料第 8 列 (0 起算)、第 27 欄
+    if df.shape[0] > 8 and df.shape[1] > 27:
+        return normalize_firepower_mode(df.iat[8, 27])
+    return "System10"
 
-@st.cache_data(ttl=60) 
-def fetch_current_prices(tickers):
+# Yahoo spark 端點一次可查多檔最新報價 (每個網址上限 20 檔)
+YAHOO_SPARK_URL = "https://query1.finance.yahoo.com/v8/finance/spark"
+SPARK_CHUNK_SIZE = 20
+SPARK_MAX_WORKERS = 8
+SPARK_TIMEOUT = 5
+# Yahoo 報價會用到 query1/query2/fc 等數個主機，各自保留一組連線池
+HTTP_POOL_HOSTS = 4
+
+def _fetch_spark_chunk(session, chunk):
+    """單一 spark 請求：回傳 {Yahoo 代號: 最新價}；優先取 meta.regularMarketPrice (盤中即時價)，缺值時退回收盤序列最後一筆"""
+    r = session.get(
+        YAHOO_SPARK_URL,
+        params={'symbols': ','.join(chunk), 'range': '1d', 'interval': '1d'},
+        timeout=SPARK_TIMEOUT,
+    )
+    r.raise_for_status()
+    closes = {}
+    # 整批錯誤時 Yahoo 回 {"spark": {"result": null, "error": ...}}，視同本批查無報價
+    for item in (r.json().get('spark') or {}).get('result') or []:
+        try:
+            resp = item['response'][0]
+            price = resp.get('meta', {}).get('regularMarketPrice')
+            if price is None:
+                quote = [c for c in resp['indicators']['quote'][0]['close'] if c is not None]
+                price = quote[-1] if quote else None
+            if price is not None: closes[item['symbol']] = price
+        except (KeyError, IndexError, TypeError): pass
+    return closes
+
+@st.cache_resource(show_spinner=False)
+def _http_session():
+    """行程共用的 keep-alive Session (spark 與 yf.download 備援共用)：連線池大小與並行數一致，重複更新股價時沿用既有 TLS 連線"""
+    import requests
+
+    session = requests.Session()
+    session.headers['User-Agent'] = 'Mozilla/5.0'
+    adapter = requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=SPARK_MAX_WORKERS)
+    session.mount('https://', adapter)
+    return session
+
+def _fetch_spark_closes(symbols):
+    """以 spark 端點分批 (每批 20 檔) 並行取最新價，共用行程層級的 keep-alive Session；失敗的批次略過，交給 yf.download 補抓"""
+    import requests
+
+    chunks = [symbols[i:i + SPARK_CHUNK_SIZE] for i in range(0, len(symbols), SPARK_CHUNK_SIZE)]
+    if not chunks: return {}
+    session = _http_session()
+    closes = {}
+    with ThreadPoolExecutor(max_workers=min(SPARK_MAX_WORKERS, len(chunks))) as ex:
+        futures = {ex.submit(_fetch_spark_chunk, session, c): c for c in chunks}
+        for f in as_completed(futures):
+            # 回應結構不符 (TypeError/AttributeError) 也只略過該批，其餘交給 yf.download 補抓
+            try: closes.update(f.result())
+            except (requests.RequestException, KeyError, ValueError, TypeError, AttributeError) as e:
+                warnings.warn(f"spark 報價失敗 {','.join(futures[f])}: {e}")
+    return closes
+
+def _download_closes(symbols):
+    """yf.download 備援：回傳 {Yahoo 代號: 最新收盤}"""
     import yfinance as yf
 
-    if not tickers: return {}
-    ticker_map = {}
-    query_tickers = []
-    
-    for t in tickers:
-        raw_t = str(t).strip()
-        if not raw_t: continue
-        if raw_t.isdigit(): y_t = f"{raw_t}.TW"
-        else: y_t = raw_t
-        ticker_map[y_t] = raw_t
-        query_tickers.append(y_t)
-    
     res = {}
     try:
-        data = yf.download(query_tickers, period='1d', interval='1d', progress=False)
+        # yf.download 內部已以執行緒並行抓取各檔；其共用狀態 (shared._DFS) 非執行緒安全，勿再外包一層 ThreadPool
+        # 與 spark 請求共用同一個 keep-alive Session，備援時不必重新建立 TLS 連線
+        data = yf.download(symbols, period='1d', interval='1d', progress=False, threads=True, session=_http_session())
         if data.empty: return {}
         try: closes = data['Close']
         except: return {}
         if closes.empty: return {}
         last_row = closes.iloc[-1]
         
-        if len(query_tickers) == 1:
+        if len(symbols) == 1:
             val = last_row
             if hasattr(val, 'item'): val = val.item()
-            res[ticker_map[query_tickers[0]]] = round(float(val), 2)
+            res[symbols[0]] = val
         else:
-            for y_t, original_t in ticker_map.items():
+            for y_t in symbols:
                 try:
                     val = last_row.get(y_t)
                     if pd.notna(val):
                          if hasattr(val, 'item'): val = val.item()
-                         res[original_t] = round(float(val), 2)
+                         res[y_t] = val
                 except: pass
         return res
     except: return {}
 
+@st.cache_data(ttl=60) 
+def fetch_current_prices(tickers):
+    if not tickers: return {}
+    ticker_map = {}
+    query_tickers = []
+    
+    for t in tickers:
+        raw_t = str(t).strip()
+        if not raw_t: continue
+        if raw_t.isdigit(): y_t = f"{raw_t}.TW"
+        else: y_t = raw_t
+        ticker_map[y_t] = raw_t
+        query_tickers.append(y_t)
+    
+    # 先走 spark 批次端點 (⌈N/20⌉ 個請求)，抓不到的才交給 yf.download
+    closes = _fetch_spark_closes(query_tickers)
+    missing = [y_t for y_t in query_tickers if y_t not in closes]
+    if missing: closes.update(_download_closes(missing))
+
+    res = {}
+    for y_t, original_t in ticker_map.items():
+        try:
+            if y_t in closes: res[original_t] = round(float(closes[y_t]), 2)
+        except: pass
+    return res
+
+def _read_price_column(sh, n):
+    """讀回 E2:E 目前的值 (數值不含格式、空白補 '')；讀取失敗回傳 None，改為整欄寫入"""
+    try:
+        resp = sh.values_get(
+            gspread.utils.absolute_range_name('表A_持股總表', f'E2:E{n+1}'),
+            # FORMULA：公式格回傳公式本身，不會被誤判為未變動而留下舊的計算結果
+            params={'valueRenderOption': 'FORMULA'},
+        )
+    except Exception: return None
+    rows = resp.get('values', [])
+    return [r[0] if r else '' for r in rows] + [''] * (n - len(rows))
+
+def _changed_span(prior, new):
+    """第一列到最後一列有變動的價格所涵蓋的連續區段 (0 起算、含結束列)；全無變動回傳 None。
+    區段內未變動的列新舊值相同，整段照寫即等於保留原值"""
+    # object 陣列逐元素比較由 NumPy 執行，不必在 Python 迴圈裡逐列比對
+    changed = np.flatnonzero(np.asarray(prior, dtype=object) != np.asarray(new, dtype=object))
+    return (changed[0], changed[-1]) if changed.size else None
+
 def write_prices_to_sheet(df_A, updates):
     _, sh = get_gsheet_connection()
     if not sh: return False
     try:
-        ws = sh.worksheet('表A_持股總表')
-        vals = []
-        for _, row in df_A.iterrows():
-            t = str(row.get('股票','')).strip()
-            p = updates.get(t)
-            if p: vals.append([p]) 
-            else: vals.append([''])
-        if vals: ws.update(f'E2:E{2+len(vals)-1}', vals, value_input_option='USER_ENTERED')
+        if '股票' in df_A.columns:
+            # 股票欄已是 Arrow 字串，直接 strip 後對照報價；查無或 0 元一律寫空白
+            prices = df_A['股票'].astype(ARROW_STRING).str.strip().map(updates).fillna('').replace(0.0, '')
+        else:
+            prices = pd.Series('', index=df_A.index)
+        new = prices.tolist()
+        if not new: return True
+        # 一律以 FORMULA 讀回目前的 E 欄比對 (快取中的表A 是格式化後的顯示值，公式、四捨五入與剛手動修改的格都會誤判為未變動)；
+        # 只寫入涵蓋所有變動列的單一連續範圍，讀不到時整欄寫入
+        prior = _read_price_column(sh, len(new))
+        span = _changed_span(prior, new) if prior is not None else (0, len(new) - 1)
+        if span:
+            a, b = span
+            sh.values_batch_update(body={
+                'valueInputOption': 'USER_ENTERED',
+                'data': [{'range': gspread.utils.absolute_range_name('表A_持股總表', f'E{a+2}:E{b+2}'), 'values': [[v] for v in new[a:b+1]]}],
+            })
         return True
     except: return False
 
+# --- 績效指標 ---
+def max_drawdown(nav):
+    """依時間排序的淨值陣列 → 最大回撤 (≤ 0)；以 np.maximum.accumulate 取歷史高點，不逐筆迴圈"""
+    nav = np.asarray(nav, dtype=float)
+    nav = nav[nav > 0]
+    if nav.size == 0: return 0.0
+    return float((nav / np.maximum.accumulate(nav) - 1.0).min())
+
+@st.cache_data(show_spinner=False)
+def nav_max_drawdown(df_F):
+    """表F 實質NAV 的最大回撤；缺欄位時回傳 None"""
+    d_col = next((c for c in df_F.columns if '日期' in c), None)
+    if not d_col or '實質NAV' not in df_F.columns: return None
+    dt = dates(df_F, d_col)
+    nav = numeric(df_F, '實質NAV')[dt.notna()]
+    return max_drawdown(nav.loc[dt[dt.notna()].sort_values().index].to_numpy())
+
+@st.cache_data(show_spinner=False)
+def group_sums(df, key_col, value_col):
+    """依 key_col 分組加總 value_col；篩選後的合計只需加總選取的幾組，不必每次重掃整張表"""
+    return numeric(df, value_col).groupby(df[key_col], observed=True, sort=False, dropna=False).sum()
+
+# --- 持股明細 ---
+# 持股明細的數字欄：顯示格式由前端 column_config 處理，這裡只轉成數值
+HOLDINGS_INT_COLS = ['持有數量（股）', '市值（元）', '浮動損益']
+HOLDINGS_MONEY_COLS = ['平均成本', '收盤價', '即時價']
+# 只把這些欄送往前端，表A 其餘工作欄不進 Arrow 序列化
+HOLDINGS_DISPLAY_COLS = {'股票', '股票名稱', '備註', '即時收盤價'} | set(HOLDINGS_INT_COLS) | set(HOLDINGS_MONEY_COLS)
+
+@st.cache_data(show_spinner=False)
+def build_holdings_view(df_A, live_prices):
+    """過濾空白與未持有標的、併入即時價並轉成數值欄；表A 與即時價皆未變動時直接取快取"""
+    df_show = df_A
+
+    # --- 戰術淨化：過濾空白行與未持有標的 ---
+    # 1. 濾除沒有股票代碼的空白行
+    tickers = df_show['股票'].astype(str).str.strip()
+    df_show = df_show[(tickers != '') & (tickers.str.lower() != 'nan')]
+    # 2. 只保留持有數量大於 0 的實際部位
+    if '持有數量（股）' in df_show.columns:
+        df_show = df_show[numeric(df_show, '持有數量（股）') > 0]
+    # ----------------------------------------
+    df_show = df_show.copy()
+
+    if live_prices:
+        # 沿用上面 strip 過的代號對照報價 (報價字典的鍵同樣是 strip 後的代號)，不必再對原欄逐列轉字串
+        df_show['即時價'] = tickers.loc[df_show.index].map(live_prices)
+
+    for c in HOLDINGS_INT_COLS + HOLDINGS_MONEY_COLS:
+        if c in df_show.columns: df_show[c] = numeric(df_show, c)
+    return df_show[[c for c in df_show.columns if c in HOLDINGS_DISPLAY_COLS]]
+
+# --- 總覽解析 ---
+@st.cache_data(show_spinner=False)
+def parse_overview(df_C):
+    """從表C_總覽取出短期目標、差距、達成進度與質押率燈號；表C 未變動時重跑直接取快取"""
+    df_c = df_C.set_index(df_C.columns[0])
+    pledge_status = fuzzy_get(df_c, '質押率燈號')
+    df_c.index = df_c.index.astype(str).str.strip()
+    col_val = df_c.columns[0]
+
+    target = safe_float(df_c.loc['短期財務目標', col_val]) if '短期財務目標' in df_c.index else 0
+    gap = safe_float(df_c.loc['短期財務目標差距', col_val]) if '短期財務目標差距' in df_c.index else 0
+
+    # 達成進度主來源：
+    # 直接用「短期財務目標」與「短期財務目標差距」反推，
+    # 避免即時監控面板的舊百分比或公式封頂造成顯示 100%。
+    pct = (target - gap) / target if target > 0 else 0.0
+
+    return {
+        'target': target,
+        'gap': gap,
+        'pct': pct,
+        'pledge_status': str(pledge_status).strip() if pledge_status else "",
+    }
+
+# --- 財富藍圖解析 ---
+BLUEPRINT_SECTION_PREFIXES = ('一、', '二、', '三、', '四、', '五、')
+
+def _blueprint_table(rows):
+    """區塊第一列為表頭，其餘為內容；無內容時回傳 None"""
+    if not rows: return None
+    body = rows[1:]
+    if not body: return None
+    return pd.DataFrame(body, columns=_dedup_columns([str(h).strip() for h in rows[0]], "-"))
+
+@st.cache_data(show_spinner=False)
+def parse_blueprint_sections(df_G):
+    """依「一、二、…」標題將財富藍圖切成區塊，回傳 [(標題, DataFrame 或 None)]；快取後重跑不必再逐列掃描"""
+    sections = []
+    current_title = None
+    current_data = []
+    for row in [df_G.columns.tolist()] + df_G.values.tolist():
+        first_cell = str(row[0]).strip()
+        if first_cell.startswith(BLUEPRINT_SECTION_PREFIXES):
+            if current_title:
+                sections.append((current_title, _blueprint_table(current_data)))
+            current_title = first_cell
+            current_data = []
+        elif any(str(c).strip() for c in row):
+            if current_title is not None:
+                current_data.append(row)
+    if current_title:
+        sections.append((current_title, _blueprint_table(current_data)))
+    return sections
+
 # --- 文字日報生成函式 ---
 def generate_daily_report(df_A, df_C, df_D, df_E, df_F, df_Monitor, live_prices_dict, df_Market=pd.DataFrame()):
     """
@@ -324,7 +818,7 @@ def generate_daily_report(df_A, df_C, df_D, df_E, df_F, df_Monitor, live_prices_
     lines.append("\n[即時監控狀態]")
     if not df_Monitor.empty:
         try:
-            firepower_mode = load_firepower_mode()
+            firepower_mode = load_firepower_mode(df_Monitor)
             # 提取上半部：變動與波動率。預設保留即時監控面板既有欄位作為fallback。
             snc_val = safe_float(df_Monitor['股市淨變動'].iloc[0]) if '股市淨變動' in df_Monitor.columns else 0
             nnc_val = safe_float(df_Monitor['NAV淨變動'].iloc[0]) if 'NAV淨變動' in df_Monitor.columns else 0
@@ -344,7 +838,7 @@ def generate_daily_report(df_A, df_C, df_D, df_E, df_F, df_Monitor, live_prices_
                     stock_col = find_report_col(df_f, ['股票市值', '股市市值', '股票總市值', '市值'])
                     nav_col = find_report_col(df_f, ['實質NAV', 'NAV', '淨值', '總資產', '總資產市值'])
                     if date_col and stock_col and nav_col:
-                        df_f['dt'] = pd.to_datetime(df_f[date_col], errors='coerce')
+                        df_f['dt'] = dates(df_f, date_col)
                         df_latest = df_f.dropna(subset=['dt']).sort_values('dt')
                         df_latest = df_latest.groupby(df_latest['dt'].dt.date).tail(1).sort_values('dt')
                         if not df_latest.empty:
@@ -387,7 +881,7 @@ def generate_daily_report(df_A, df_C, df_D, df_E, df_F, df_Monitor, live_prices_
             rz = str(monitor_bottom_dict.get('RZ_Level', 'N/A'))
             
             cmd_val = str(monitor_bottom_dict.get('今日指令', 'N/A'))
-            cmd = re.sub(r"【Debug.*?】", "", cmd_val, flags=re.DOTALL).strip()
+            cmd = DEBUG_TAG_RE.sub("", cmd_val).strip()
             
             # 從 df_Market 獲取大盤指數與漲跌幅
             idx_str = "N/A"
@@ -429,7 +923,7 @@ def generate_daily_report(df_A, df_C, df_D, df_E, df_F, df_Monitor, live_prices_
             df_A_clean = df_A_clean[df_A_clean['股票'].astype(str).str.strip() != '']
             df_A_clean = df_A_clean[df_A_clean['股票'].astype(str).str.strip().str.lower() != 'nan']
         if '持有數量（股）' in df_A_clean.columns:
-            df_A_clean = df_A_clean[df_A_clean['持有數量（股）'].apply(safe_float) > 0]
+            df_A_clean = df_A_clean[numeric(df_A_clean, '持有數量（股）') > 0]
         # ----------------------------------------
 
         for _, row in df_A_clean.iterrows():
@@ -473,15 +967,15 @@ def generate_daily_report(df_A, df_C, df_D, df_E, df_F, df_Monitor, live_prices_
             nav_col = find_report_col(df_f, ['實質NAV', 'NAV', '淨值', '總資產', '總資產市值'])
             total_col = find_report_col(df_f, ['總資產', '總資產市值', '實質NAV', 'NAV', '淨值'])
             if date_col:
-                df_f['dt'] = pd.to_datetime(df_f[date_col], errors='coerce')
+                df_f['dt'] = dates(df_f, date_col)
                 df_f = df_f.dropna(subset=['dt']).sort_values('dt')
                 df_f = df_f.groupby(df_f['dt'].dt.date).tail(1).sort_values('dt')
                 if stock_col:
-                    df_f['股票變動'] = df_f[stock_col].apply(safe_float).diff().fillna(0)
+                    df_f['股票變動'] = numeric(df_f, stock_col).diff().fillna(0)
                 else:
                     df_f['股票變動'] = 0
                 if nav_col:
-                    df_f['NAV變動'] = df_f[nav_col].apply(safe_float).diff().fillna(0)
+                    df_f['NAV變動'] = numeric(df_f, nav_col).diff().fillna(0)
                 else:
                     df_f['NAV變動'] = 0
                 last_3 = df_f.tail(3)
@@ -523,7 +1017,7 @@ def generate_daily_report(df_A, df_C, df_D, df_E, df_F, df_Monitor, live_prices_
             df_d = df_D.copy()
             date_col = next((c for c in df_d.columns if '日期' in c), None)
             if date_col:
-                df_d['dt'] = pd.to_datetime(df_d[date_col], errors='coerce')
+                df_d['dt'] = dates(df_d, date_col)
                 unique_dates = sorted(df_d['dt'].dt.date.dropna().unique(), reverse=True)[:3]
                 last_d = df_d[df_d['dt'].dt.date.isin(unique_dates)].sort_values('dt', ascending=True)
                 
@@ -541,7 +1035,7 @@ def generate_daily_report(df_A, df_C, df_D, df_E, df_F, df_Monitor, live_prices_
                     note = str(row.get('備註', '')).strip()
                     note_str = f"備註：{note}" if note else ""
                     line = f"{d} {item} {act} {qty} {price} {amt_str} {note_str}"
-                    lines.append(re.sub(' +', ' ', line).strip())
+                    lines.append(_MULTI_SPACE_RE.sub(' ', line).strip())
             else:
                 lines.append("表D無日期欄位")
         except: lines.append("表D解析錯誤")
@@ -553,7 +1047,7 @@ def generate_daily_report(df_A, df_C, df_D, df_E, df_F, df_Monitor, live_prices_
             df_e = df_E.copy()
             d_col = next((c for c in df_e.columns if '日期' in c), None)
             if d_col:
-                df_e['dt'] = pd.to_datetime(df_e[d_col], errors='coerce')
+                df_e['dt'] = dates(df_e, d_col)
                 unique_dates = sorted(df_e['dt'].dt.date.dropna().unique(), reverse=True)[:3]
                 last_e = df_e[df_e['dt'].dt.date.isin(unique_dates)].sort_values('dt', ascending=True)
                 
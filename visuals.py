@@ -1,3 +1,5 @@
+import re
+import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
@@ -7,8 +9,8 @@ import data_manager as dm
 
 
 # --- CSS 樣式 ---
-def get_custom_css():
-    return """
+# 樣式表為固定字串，模組載入時建立並壓縮一次；每次重跑仍須送出 (Streamlit 會移除該次重跑未再輸出的元素)
+_CSS_SOURCE = """
     <style>
     .block-container {
         padding-top: 5rem;
@@ -31,8 +33,16 @@ def get_custom_css():
         border: 1px solid #ccc;
     }
 
-    .stProgress > div > div > div > div {
-        background-color: #00b4d8;
+    /* 共用宣告：直向置中的卡片與可任意斷行的文字 */
+    .custom-metric-card, .live-card, .mini-metric-card, .mini-metric-value {
+        display: flex;
+        flex-direction: column;
+        justify-content: center;
+    }
+
+    .mindset-card, .live-card-label, .live-card-value, .mini-metric-value {
+        overflow-wrap: anywhere;
+        word-break: break-word;
     }
 
     .custom-metric-card {
@@ -42,9 +52,6 @@ def get_custom_css():
         padding: 12px;
         text-align: center;
         height: 100%;
-        display: flex;
-        flex-direction: column;
-        justify-content: center;
     }
 
     .metric-label {
@@ -84,8 +91,6 @@ def get_custom_css():
         min-height: 64px;
         width: 100%;
         line-height: 1.35;
-        overflow-wrap: anywhere;
-        word-break: break-word;
         transition: background-color 0.35s ease, box-shadow 0.35s ease, border-color 0.35s ease;
         animation: cardFadeIn 0.35s ease-out;
     }
@@ -97,9 +102,6 @@ def get_custom_css():
         margin-bottom:10px;
         border:1px solid #e9ecef;
         min-height:118px;
-        display:flex;
-        flex-direction:column;
-        justify-content:center;
         align-items:center;
         text-align:center;
         line-height:1.2;
@@ -114,8 +116,6 @@ def get_custom_css():
         color:#6c757d;
         line-height:1.25;
         margin-bottom:4px;
-        overflow-wrap:anywhere;
-        word-break:break-word;
     }
 
     .live-card-value {
@@ -126,16 +126,11 @@ def get_custom_css():
         display:flex;
         align-items:center;
         justify-content:center;
-        overflow-wrap:anywhere;
-        word-break:break-word;
     }
 
     .mini-metric-card {
         min-height: 92px;
         padding: 4px 0;
-        display:flex;
-        flex-direction:column;
-        justify-content:center;
         transition: color 0.3s ease;
         animation: cardFadeIn 0.3s ease-out;
     }
@@ -154,11 +149,6 @@ def get_custom_css():
         font-size:1.75rem;
         font-weight:700;
         line-height:1.15;
-        display:flex;
-        flex-direction:column;
-        justify-content:center;
-        overflow-wrap:anywhere;
-        word-break:break-word;
     }
 
     .live-highlight {
@@ -173,67 +163,81 @@ def get_custom_css():
     """
 
 
+def _minify_css(css):
+    """移除註解與多餘空白 (含 {}:;,> 兩側)，縮小每次重跑送往前端的位元組數"""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.DOTALL)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{}:;,>])\s*', r'\1', css)
+    return css.replace(';}', '}').strip()
+
+
+CUSTOM_CSS = _minify_css(_CSS_SOURCE)
+
+
 # --- 圖表繪製 ---
+# 圖表以 cache_resource 快取：重跑時直接沿用同一個 Figure 物件，不必每次反序列化 (st.plotly_chart 不會修改傳入的圖表)；
+# 回傳的 Figure 為共用物件，呼叫端不可再 update_layout 等就地修改
+FIGURE_CACHE_ENTRIES = 8
+
 def plot_asset_allocation(df_B):
-    """繪製資產配置圓餅圖"""
+    """繪製資產配置圓餅圖；篩選後只以 (名稱, 市值) 兩個 tuple 作為快取鍵，表B 其他欄位變動不會讓圖表重建"""
     if not df_B.empty and '市值（元）' in df_B.columns:
-        df_B = df_B.copy()
-        df_B['num'] = df_B['市值（元）'].apply(dm.safe_float)
+        num = dm.numeric(df_B, '市值（元）')
+        mask = (num > 0) & ~dm.total_rows(df_B)
+        if mask.any():
+            return _build_allocation_pie(tuple(df_B.loc[mask, '股票']), tuple(num[mask]))
 
-        chart_data = df_B[
-            (df_B['num'] > 0)
-            & (~df_B['股票'].astype(str).str.contains('總資產|Total', na=False))
-        ]
+    return None
 
-        if not chart_data.empty:
-            color_discrete_sequence = ['#0077b6', '#00b4d8', '#90e0ef', '#caf0f8']
+@st.cache_resource(show_spinner=False, max_entries=FIGURE_CACHE_ENTRIES)
+def _build_allocation_pie(names, values):
+    color_discrete_sequence = ['#0077b6', '#00b4d8', '#90e0ef', '#caf0f8']
 
-            fig = px.pie(
-                chart_data,
-                values='num',
-                names='股票',
-                color_discrete_sequence=color_discrete_sequence
-            )
-
-            fig.update_layout(
-                margin=dict(t=10, b=10, l=10, r=10),
-                legend=dict(
-                    orientation="h",
-                    yanchor="bottom",
-                    y=-0.2,
-                    xanchor="center",
-                    x=0.5
-                )
-            )
+    fig = px.pie(
+        pd.DataFrame({'股票': names, 'num': values}),
+        values='num',
+        names='股票',
+        color_discrete_sequence=color_discrete_sequence
+    )
 
-            return fig
+    fig.update_layout(
+        margin=dict(t=10, b=10, l=10, r=10),
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=-0.2,
+            xanchor="center",
+            x=0.5
+        )
+    )
 
-    return None
+    return fig
 
 
+@st.cache_resource(show_spinner=False, max_entries=FIGURE_CACHE_ENTRIES)
 def plot_nav_trend(df_F):
     """繪製戰略級 NAV 趨勢與淨變動複合圖"""
     if not df_F.empty:
         df_calc = df_F.copy()
 
         if '實質NAV' in df_calc.columns and '日期' in df_calc.columns:
-            df_calc['dt'] = pd.to_datetime(df_calc['日期'], errors='coerce')
-            df_calc['nav'] = df_calc['實質NAV'].apply(dm.safe_float)
+            df_calc['dt'] = dm.dates(df_calc, '日期')
+            df_calc['nav'] = dm.numeric(df_calc, '實質NAV')
             if '股票市值' in df_calc.columns:
-                df_calc['stock_value'] = df_calc['股票市值'].apply(dm.safe_float)
+                df_calc['stock_value'] = dm.numeric(df_calc, '股票市值')
             else:
                 df_calc['stock_value'] = np.nan
 
             if 'NAV淨變動' in df_calc.columns:
-                df_calc['net_change'] = df_calc['NAV淨變動'].apply(dm.safe_float)
+                df_calc['net_change'] = dm.numeric(df_calc, 'NAV淨變動')
             elif '當日淨變動' in df_calc.columns:
-                df_calc['net_change'] = df_calc['當日淨變動'].apply(dm.safe_float)
+                df_calc['net_change'] = dm.numeric(df_calc, '當日淨變動')
             else:
                 df_calc['net_change'] = 0.0
 
             df_chart = df_calc.sort_values('dt').reset_index(drop=True)
             if '股市市值變化' in df_chart.columns:
-                df_chart['stock_value_change'] = df_chart['股市市值變化'].apply(dm.safe_float)
+                df_chart['stock_value_change'] = dm.numeric(df_chart, '股市市值變化')
             else:
                 df_chart['stock_value_change'] = df_chart['stock_value'].diff().fillna(0)
 
@@ -432,13 +436,13 @@ def plot_nav_trend(df_F):
     return None
 
 
+@st.cache_resource(show_spinner=False, max_entries=FIGURE_CACHE_ENTRIES)
 def plot_wealth_trajectory(df_F=None):
     """繪製 NEGENTROPIC ATARAXIA 財富路徑導航圖"""
 
     def date_to_frac_year(dt):
-        """將日期轉成小數年份座標。"""
-        dt = pd.to_datetime(dt)
-        return dt.year + (dt.dayofyear - 1) / 365.25
+        """將日期序列轉成小數年份座標 (整欄向量化計算)。"""
+        return dt.dt.year + (dt.dt.dayofyear - 1) / 365.25
 
     def frac_year_to_quarter_label(x):
         """將小數年份轉成季度標籤，例如 2026.25 -> 2026 Q2。"""
@@ -607,15 +611,15 @@ def plot_wealth_trajectory(df_F=None):
         date_col = next((c for c in df_real.columns if '日期' in c), None)
 
         if date_col and '實質NAV' in df_real.columns:
-            df_real['dt'] = pd.to_datetime(df_real[date_col], errors='coerce')
-            df_real['nav_raw'] = df_real['實質NAV'].apply(dm.safe_float)
+            df_real['dt'] = dm.dates(df_real, date_col)
+            df_real['nav_raw'] = dm.numeric(df_real, '實質NAV')
             df_real = df_real.dropna(subset=['dt'])
             df_real = df_real[df_real['nav_raw'] > 0]
 
             if not df_real.empty:
                 has_real = True
                 df_real = df_real.sort_values('dt')
-                df_real['frac_year'] = df_real['dt'].apply(date_to_frac_year)
+                df_real['frac_year'] = date_to_frac_year(df_real['dt'])
                 df_real['nav_m'] = df_real['nav_raw'] / 1000000.0
                 df_real['date_str'] = df_real['dt'].dt.strftime('%Y-%m-%d')
 
@@ -739,7 +743,7 @@ def plot_wealth_trajectory(df_F=None):
     daily_dates = pd.date_range(start='2025-07-01', end='2040-12-31', freq='D')
     hover_df = pd.DataFrame({'dt': daily_dates})
     hover_df['date_label'] = hover_df['dt'].dt.strftime('%Y-%m-%d')
-    hover_df['frac_year'] = hover_df['dt'].apply(date_to_frac_year)
+    hover_df['frac_year'] = date_to_frac_year(hover_df['dt'])
 
     # 四條主路徑每日內插
     hover_df['exp_20'] = np.interp(hover_df['frac_year'], theoretical_x, nav_20)
@@ -961,44 +965,40 @@ def plot_wealth_trajectory(df_F=None):
 
 
 # --- HTML 卡片產生器 ---
-def render_risk_metric_card(risk_text, lev_value, style_dict):
-    return f"""
+# 卡片骨架為固定字串，只以 format 填入動態欄位，避免每次重跑重組整段 HTML
+_RISK_METRIC_CARD_TPL = """
     <div class='custom-metric-card'>
-        <div class='metric-badge' style='background-color: {style_dict['bg']}; color: {style_dict['t']};'>
-            {style_dict['e']} {risk_text}
+        <div class='metric-badge' style='background-color: {bg}; color: {t};'>
+            {e} {risk_text}
         </div>
         <div class='metric-label'>曝險倍數</div>
         <div class='metric-value'>{lev_value:.2f}</div>
     </div>
     """
 
-
-def render_goal_progress_card(target, gap, pct):
-    return f"""
+_GOAL_PROGRESS_CARD_TPL = """
     <div class="live-card live-highlight">
         <div class="live-card-label">達成進度</div>
         <div class="live-card-value" style="color:#007BFF;">
-            {pct*100:.1f}%
+            {pct:.1f}%
         </div>
         <div style="margin-top:8px; min-height:20px; font-size:0.85em; display:flex; justify-content:space-between; color:#495057; line-height:1.25; width:100%;">
-            <span>目標: <b>{dm.fmt_int(target)}</b></span>
+            <span>目標: <b>{target}</b></span>
         </div>
         <div style="min-height:18px; text-align:right; font-size:0.8em; color:#e63946; margin-top:2px; line-height:1.2; width:100%;">
-            (差 {dm.fmt_int(gap)})
+            (差 {gap})
         </div>
     </div>
     """
 
-
-def render_house_plan_card(r_display, dp_target, est_year):
-    return f"""
+_HOUSE_PLAN_CARD_TPL = """
     <div style="background-color:#f8f9fa; padding:15px; border-radius:10px; margin-bottom:10px; border:1px solid #e9ecef; height: 100%; display: flex; flex-direction: column; justify-content: center;">
         <div style="font-size:1.0em; color:#6c757d; margin-bottom:5px;">房屋準備度 R</div>
         <div style="font-size:2.2em; font-weight:bold; color:#00b4d8; line-height:1.1;">
             {r_display}
         </div>
         <div style="margin-top:8px; font-size:0.85em; display:flex; justify-content:space-between; color:#495057;">
-            <span>頭期款: <b>{dm.fmt_int(dp_target)}</b></span>
+            <span>頭期款: <b>{dp_target}</b></span>
         </div>
         <div style="text-align:right; font-size:0.8em; color:#6c757d; margin-top:2px;">
             (預估 {est_year} 年)
@@ -1006,10 +1006,7 @@ def render_house_plan_card(r_display, dp_target, est_year):
     </div>
     """
 
-
-def render_simple_card(title, value, value_color="#212529"):
-    """通用數值展示卡片"""
-    return f"""
+_SIMPLE_CARD_TPL = """
     <div class="live-card live-highlight">
         <div class="live-card-label">{title}</div>
         <div class="live-card-value" style="color:{value_color};">
@@ -1018,19 +1015,40 @@ def render_simple_card(title, value, value_color="#212529"):
     </div>
     """
 
-
-def render_mindset_card(mindset_text):
-    return f"""
+_MINDSET_CARD_TPL = """
     <div class="mindset-card">
         <div style="line-height:1.35;">💡 <b>心態提醒：</b> {mindset_text}</div>
     </div>
     """
 
-
-def render_mini_metric(label, value, color="black"):
-    return f"""
+_MINI_METRIC_TPL = """
     <div class='mini-metric-card'>
         <div class='mini-metric-label'>{label}</div>
         <div class='mini-metric-value' style='color:{color};'>{value}</div>
     </div>
     """
+
+
+def render_risk_metric_card(risk_text, lev_value, style_dict):
+    return _RISK_METRIC_CARD_TPL.format_map({**style_dict, 'risk_text': risk_text, 'lev_value': lev_value})
+
+
+def render_goal_progress_card(target, gap, pct):
+    return _GOAL_PROGRESS_CARD_TPL.format(pct=pct * 100, target=dm.fmt_int(target), gap=dm.fmt_int(gap))
+
+
+def render_house_plan_card(r_display, dp_target, est_year):
+    return _HOUSE_PLAN_CARD_TPL.format(r_display=r_display, dp_target=dm.fmt_int(dp_target), est_year=est_year)
+
+
+def render_simple_card(title, value, value_color="#212529"):
+    """通用數值展示卡片"""
+    return _SIMPLE_CARD_TPL.format(title=title, value=value, value_color=value_color)
+
+
+def render_mindset_card(mindset_text):
+    return _MINDSET_CARD_TPL.format(mindset_text=mindset_text)
+
+
+def render_mini_metric(label, value, color="black"):
+    return _MINI_METRIC_TPL.format(label=label, value=value, color=color)